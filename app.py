@@ -3,74 +3,193 @@ Quantum Inspired Emotion Recommender for Dance
 A simple, all-in-one Flask application
 """
 
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, request, jsonify
+from flask_caching import Cache
 import cv2
 import numpy as np
-from scipy.linalg import expm
 import os
+import math
+import json
+import mmap
+import hashlib
 from werkzeug.utils import secure_filename
 import uuid
+import shutil
+import zlib
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import threading
+import sys
+import contextlib
+import tempfile
+
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:  # Numba is optional; motion reduction falls back to NumPy
+    HAS_NUMBA = False
+
+# Optical flow runs on the GPU when OpenCV is built with CUDA and a device is present
+HAS_CUDA = hasattr(cv2, 'cuda') and cv2.cuda.getCudaEnabledDeviceCount() > 0
+
+# Uploads already spooled to disk are copied in-kernel; only Linux sendfile accepts a file destination
+HAS_SENDFILE = hasattr(os, 'sendfile') and sys.platform.startswith('linux')
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:  # orjson is optional; responses fall back to the stdlib encoder
+    HAS_ORJSON = False
 
 # ============================================================================
 # CONFIGURATION
 # ============================================================================
 
 UPLOAD_FOLDER = 'uploads'
+CACHE_FOLDER = 'cache'  # FileSystemCache directory for analysis results
+
+# Shared, bounded result cache. Defaults to the filesystem so every worker on a
+# node sees the same entries; set CACHE_TYPE=RedisCache for multi-node deploys.
+CACHE_CONFIG = {
+    'CACHE_TYPE': os.environ.get('CACHE_TYPE', 'FileSystemCache'),
+    'CACHE_DIR': CACHE_FOLDER,
+    'CACHE_THRESHOLD': 1000,
+    'CACHE_DEFAULT_TIMEOUT': 3600,
+    'CACHE_KEY_PREFIX': 'qdr:',
+    'CACHE_REDIS_URL': os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0'),
+}
 MAX_FILE_SIZE = 100 * 1024 * 1024  # 100MB
 ALLOWED_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv', 'webm'}
 FRAME_SAMPLE_RATE = 5  # Process every 5th frame
+FLOW_SHORT_EDGE = 360  # Downscale frames to this short edge for optical flow and face detection
+# Optional YuNet face detection model (e.g. face_detection_yunet_2023mar_int8.onnx
+# from opencv_zoo); falls back to the Haar cascade when the file is missing
+YUNET_MODEL_PATH = os.environ.get('YUNET_MODEL_PATH', 'face_detection_yunet.onnx')
 
 FACIAL_EMOTIONS = ['happy', 'sad', 'angry', 'surprise', 'neutral', 'fear', 'disgust']
 MOVEMENT_EMOTIONS = ['energetic', 'calm', 'aggressive', 'graceful', 'playful', 'melancholic']
 DANCE_STYLES = ['Ballet', 'Hip-Hop', 'Contemporary', 'Jazz', 'Salsa', 'Breakdance', 'Ballroom', 'Tap', 'Lyrical', 'Freestyle']
+# Emotions travel through the pipeline as float32 vectors laid out in this order
+EMOTION_ORDER = FACIAL_EMOTIONS + MOVEMENT_EMOTIONS
+EMOTION_INDEX = {e: i for i, e in enumerate(EMOTION_ORDER)}
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+os.makedirs(CACHE_FOLDER, exist_ok=True)
+
+# Shared pool for overlapping independent pipeline stages
+executor = ThreadPoolExecutor(max_workers=4)
+
+# Per-thread OpenCV objects and scratch buffers that must not be shared across pool threads
+_thread_local = threading.local()
 
 # ============================================================================
 # VIDEO PROCESSING & EMOTION ANALYSIS
 # ============================================================================
 
+if HAS_NUMBA:
+    @njit(cache=True, fastmath=True)
+    def reduce_motion(new, old, prev_velocity):
+        """Mean displacement of tracked points and its change since the last step"""
+        total = 0.0
+        for i in range(new.shape[0]):
+            dx = new[i, 0] - old[i, 0]
+            dy = new[i, 1] - old[i, 1]
+            total += math.sqrt(dx * dx + dy * dy)
+        velocity = total / new.shape[0]
+        return velocity, abs(velocity - prev_velocity)
+else:
+    def reduce_motion(new, old, prev_velocity):
+        """Mean displacement of tracked points and its change since the last step"""
+        motion = new - old
+        velocity = float(np.sqrt(np.einsum('ij,ij->i', motion, motion)).mean())
+        return velocity, abs(velocity - prev_velocity)
+
+def _track_points_cuda(prev_gray, gray, prev_points):
+    """Sparse Lucas-Kanade on the GPU; returns (next_points, status) shaped like the CPU version"""
+    lk = getattr(_thread_local, 'cuda_lk', None)
+    if lk is None:
+        lk = cv2.cuda.SparsePyrLKOpticalFlow_create(winSize=(15, 15), maxLevel=2, iters=10)
+        _thread_local.cuda_lk = lk
+    
+    stream = cv2.cuda.Stream()
+    prev_gpu, cur_gpu, points_gpu = cv2.cuda_GpuMat(), cv2.cuda_GpuMat(), cv2.cuda_GpuMat()
+    prev_gpu.upload(prev_gray, stream)
+    cur_gpu.upload(gray, stream)
+    points_gpu.upload(prev_points.reshape(1, -1, 2), stream)
+    next_gpu, status_gpu, _ = lk.calc(prev_gpu, cur_gpu, points_gpu, None, stream=stream)
+    stream.waitForCompletion()
+    
+    # Only the tracked points and their status come back to the host
+    return next_gpu.download().reshape(-1, 1, 2), status_gpu.download().reshape(-1, 1)
+
 def process_video(video_path):
     """Extract motion features from video using optical flow"""
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
         raise ValueError("Could not open video")
     
-    velocities, accelerations = [], []
-    prev_gray, prev_velocity = None, 0
+    # Running velocity statistics (Welford) and running mean acceleration
+    v_count, v_mean, v_m2, v_max = 0, 0.0, 0.0, 0.0
+    a_mean = 0.0
+    prev_gray, prev_velocity = None, 0.0
     frame_count = 0
     sample_frames = []
     
-    # Optical flow parameters
-    feature_params = dict(maxCorners=100, qualityLevel=0.3, minDistance=7, blockSize=7)
+    # Motion is tracked on frames downscaled to FLOW_SHORT_EDGE
+    short_edge = min(cap.get(cv2.CAP_PROP_FRAME_WIDTH), cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    scale = min(1.0, FLOW_SHORT_EDGE / short_edge) if short_edge > 0 else 1.0
+    
+    # Optical flow parameters (feature spacing scaled with the frame)
+    feature_params = dict(maxCorners=100, qualityLevel=0.3, minDistance=max(1, round(7 * scale)), blockSize=7)
     lk_params = dict(winSize=(15, 15), maxLevel=2, criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
     
     while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
+        # grab() only advances the decoder; sampled frames are then retrieve()d,
+        # so skipped frames never pay for colour conversion and array copies
+        if not cap.grab():
             break
         
         if frame_count % FRAME_SAMPLE_RATE == 0:
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            ret, frame = cap.retrieve()
+            if not ret:
+                break
+            
+            small = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1.0 else frame
+            gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
             
             if prev_gray is not None:
                 # Detect and track features
                 prev_points = cv2.goodFeaturesToTrack(prev_gray, mask=None, **feature_params)
                 if prev_points is not None:
-                    next_points, status, _ = cv2.calcOpticalFlowPyrLK(prev_gray, gray, prev_points, None, **lk_params)
+                    if HAS_CUDA:
+                        next_points, status = _track_points_cuda(prev_gray, gray, prev_points)
+                    else:
+                        next_points, status, _ = cv2.calcOpticalFlowPyrLK(prev_gray, gray, prev_points, None, **lk_params)
                     if next_points is not None:
-                        good_new = next_points[status == 1]
-                        good_old = prev_points[status == 1]
+                        # One (N,) mask over the (N, 1, 2) arrays yields contiguous (M, 2) float32 copies
+                        tracked = status.ravel() == 1
+                        good_new = next_points[tracked, 0]
+                        good_old = prev_points[tracked, 0]
                         
                         if len(good_new) > 0:
-                            motion = good_new - good_old
-                            velocity = np.mean(np.linalg.norm(motion, axis=1))
-                            velocities.append(velocity)
-                            accelerations.append(abs(velocity - prev_velocity))
+                            velocity, acceleration = reduce_motion(good_new, good_old, prev_velocity)
                             prev_velocity = velocity
+                            
+                            # Report motion in source-resolution pixels
+                            velocity /= scale
+                            acceleration /= scale
+                            v_count += 1
+                            delta = velocity - v_mean
+                            v_mean += delta / v_count
+                            v_m2 += delta * (velocity - v_mean)
+                            v_max = max(v_max, velocity)
+                            a_mean += (acceleration - a_mean) / v_count
             
+            # Keep the downscaled frame for face detection, JPEG-encoded to keep memory low
             if len(sample_frames) < 10:
-                sample_frames.append(frame)
+                sample_frames.append(cv2.imencode('.jpg', small, [cv2.IMWRITE_JPEG_QUALITY, 80])[1].tobytes())
             prev_gray = gray
         
         frame_count += 1
@@ -78,10 +197,10 @@ def process_video(video_path):
     cap.release()
     
     # Aggregate features
-    avg_velocity = float(np.mean(velocities)) if velocities else 0.0
-    max_velocity = float(np.max(velocities)) if velocities else 0.0
-    velocity_variance = float(np.var(velocities)) if velocities else 0.0
-    avg_acceleration = float(np.mean(accelerations)) if accelerations else 0.0
+    avg_velocity = float(v_mean)
+    max_velocity = float(v_max)
+    velocity_variance = float(v_m2 / v_count) if v_count else 0.0
+    avg_acceleration = float(a_mean)
     
     # Normalize
     max_val = max(avg_velocity, max_velocity, 1.0)
@@ -96,53 +215,95 @@ def process_video(video_path):
         'sample_frames': sample_frames
     }
 
-def analyze_emotions(features):
-    """Analyze emotions from movement features"""
-    # Face detection
-    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+def _facial_prior(weights):
+    """Read-only emotion vector with the given weights in FACIAL_EMOTIONS order"""
+    prior = np.zeros(len(EMOTION_ORDER), dtype=np.float32)
+    prior[:len(FACIAL_EMOTIONS)] = weights
+    prior.setflags(write=False)
+    return prior
+
+# Facial emotions (simplified)
+FACE_PRESENT_EMOTIONS = _facial_prior([0.3, 0.1, 0.05, 0.2, 0.3, 0.03, 0.02])
+NO_FACE_EMOTIONS = _facial_prior(1.0/len(FACIAL_EMOTIONS))
+
+def _face_detector():
+    """Per-thread face detector (detector instances must not be shared across threads)
+    
+    Uses OpenCV's YuNet CNN when its model file is available, otherwise the Haar cascade.
+    """
+    detector = getattr(_thread_local, 'face_detector', None)
+    if detector is None:
+        if hasattr(cv2, 'FaceDetectorYN') and os.path.exists(YUNET_MODEL_PATH):
+            detector = cv2.FaceDetectorYN.create(YUNET_MODEL_PATH, '', (FLOW_SHORT_EDGE, FLOW_SHORT_EDGE), 0.9)
+        else:
+            detector = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        _thread_local.face_detector = detector
+    return detector
+
+def _detect_face(sample):
+    """Check a JPEG-encoded sample frame for a face"""
+    buf = np.frombuffer(sample, np.uint8)
+    detector = _face_detector()
+    if isinstance(detector, cv2.CascadeClassifier):
+        # Decoding straight to grayscale skips the chroma planes and the colour conversion
+        gray = cv2.imdecode(buf, cv2.IMREAD_GRAYSCALE)
+        return len(detector.detectMultiScale(gray, 1.1, 4)) > 0
+    
+    frame = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+    detector.setInputSize((frame.shape[1], frame.shape[0]))
+    _, faces = detector.detect(frame)
+    return faces is not None
+
+def _analyze_facial_presence(samples):
+    """Estimate facial emotions from whether a face appears in the sample frames"""
+    # Detect on all sample frames in parallel and stop at the first hit
+    futures = [executor.submit(_detect_face, sample) for sample in samples]
     face_detected = False
-    for frame in features['sample_frames']:
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = face_cascade.detectMultiScale(gray, 1.1, 4)
-        if len(faces) > 0:
+    for future in as_completed(futures):
+        if future.result():
             face_detected = True
             break
+    for future in futures:
+        future.cancel()
     
-    # Facial emotions (simplified)
-    if face_detected:
-        facial = {'happy': 0.3, 'neutral': 0.3, 'surprise': 0.2, 'sad': 0.1, 'angry': 0.05, 'fear': 0.03, 'disgust': 0.02}
-    else:
-        facial = {e: 1.0/len(FACIAL_EMOTIONS) for e in FACIAL_EMOTIONS}
-    
-    # Movement emotions
+    return FACE_PRESENT_EMOTIONS if face_detected else NO_FACE_EMOTIONS
+
+def _analyze_movement_emotions(features):
+    """Map aggregated motion features to movement emotions"""
     v, a = features['avg_velocity'], features['avg_acceleration']
     var = features['velocity_variance']
     
-    movement = {
-        'energetic': min(1.0, (v * 2 + a) / 2),
-        'calm': max(0.0, 1.0 - (v + var) / 2),
-        'aggressive': min(1.0, (a * 2 + var) / 2),
-        'graceful': 0.7 if (v > 0.3 and var < 0.3) else 0.3,
-        'playful': min(1.0, (v + a) / 2),
-        'melancholic': max(0.0, 1.0 - (v + a) / 2)
-    }
+    movement = np.zeros(len(EMOTION_ORDER), dtype=np.float32)
+    movement[len(FACIAL_EMOTIONS):] = [
+        min(1.0, (v * 2 + a) / 2),                  # energetic
+        max(0.0, 1.0 - (v + var) / 2),              # calm
+        min(1.0, (a * 2 + var) / 2),                # aggressive
+        0.7 if (v > 0.3 and var < 0.3) else 0.3,    # graceful
+        min(1.0, (v + a) / 2),                      # playful
+        max(0.0, 1.0 - (v + a) / 2)                 # melancholic
+    ]
     
     # Normalize movement
-    total = sum(movement.values())
+    total = movement.sum()
     if total > 0:
-        movement = {k: v/total for k, v in movement.items()}
-    
-    # Combine (40% facial, 60% movement)
-    combined = {}
-    for emotion in set(list(facial.keys()) + list(movement.keys())):
-        combined[emotion] = facial.get(emotion, 0) * 0.4 + movement.get(emotion, 0) * 0.6
-    
-    total = sum(combined.values())
-    if total > 0:
-        combined = {k: v/total for k, v in combined.items()}
-    
+        movement /= total
+    return movement
+
+def analyze_emotions(features):
+    """Analyze emotions from movement features, as a vector in EMOTION_ORDER"""
+    facial = _analyze_facial_presence(features['sample_frames'])
+    movement = _analyze_movement_emotions(features)
+    
+    # Combine (40% facial, 60% movement); the facial prior always sums to 1,
+    # so the total is never zero
+    combined = facial * 0.4 + movement * 0.6
+    combined /= combined.sum()
     return combined
 
+def format_emotion_data(emotions):
+    """Convert an emotion vector back to a dict of emotion -> NumPy score"""
+    return dict(zip(EMOTION_ORDER, emotions))
+
 # ============================================================================
 # RECOMMENDATION MODELS
 # ============================================================================
@@ -159,71 +320,258 @@ EMOTION_DANCE_MAP = {
     'melancholic': {'Contemporary': 0.9, 'Lyrical': 0.8}
 }
 
+DANCE_INDEX = {d: i for i, d in enumerate(DANCE_STYLES)}
+DANCE_ARR = np.array(DANCE_STYLES, dtype=object)
+
+def _build_affinity_matrix():
+    """Dense (n_emotions, n_dances) matrix built once from EMOTION_DANCE_MAP"""
+    affinity = np.zeros((len(EMOTION_ORDER), len(DANCE_STYLES)), dtype=np.float32)
+    for emotion, dances in EMOTION_DANCE_MAP.items():
+        for dance, value in dances.items():
+            affinity[EMOTION_INDEX[emotion], DANCE_INDEX[dance]] = value
+    return affinity
+
+AFFINITY = _build_affinity_matrix()
+
+# Single-precision complex keeps the quantum state small and SIMD friendly
+QUANTUM_DTYPE = np.complex64
+QUANTUM_DIMENSIONS = 16
+
+def _quantum_buffers():
+    """Per-thread scratch buffers for the quantum state, superposition phases and entanglement angles"""
+    buffers = getattr(_thread_local, 'quantum_buffers', None)
+    if buffers is None:
+        buffers = (np.zeros(QUANTUM_DIMENSIONS, dtype=QUANTUM_DTYPE),
+                   np.zeros(min(QUANTUM_DIMENSIONS, len(EMOTION_ORDER)), dtype=np.float32),
+                   np.zeros(min(QUANTUM_DIMENSIONS, len(DANCE_STYLES)), dtype=np.float32))
+        _thread_local.quantum_buffers = buffers
+    return buffers
+
+def _top_k(scores, k):
+    """Indices of the k highest scores, best first; ties keep DANCE_STYLES order"""
+    # A full stable sort is cheap at this size and, unlike argpartition,
+    # breaks ties by index
+    return np.argsort(-scores, kind='stable')[:k]
+
+def _emotion_key(emotions):
+    """Emotion vector quantized to 2 decimals, used as a cache key"""
+    return tuple(np.round(emotions, 2).tolist())
+
 def classical_recommend(emotions):
     """Classical weighted recommendation"""
-    scores = {style: 0.0 for style in DANCE_STYLES}
-    
-    for emotion, intensity in emotions.items():
-        if emotion in EMOTION_DANCE_MAP:
-            for dance, affinity in EMOTION_DANCE_MAP[emotion].items():
-                scores[dance] += intensity * affinity
+    return _classical_recommend(_emotion_key(emotions))
+
+def _classical_recommend(key):
+    vec = np.array(key, dtype=np.float32)
+    scores = vec @ AFFINITY
     
-    # Top 5
-    sorted_dances = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:5]
+    # Top 5, dropping dances with no affinity at all
+    top = _top_k(scores, 5)
+    top = top[scores[top] > 0]
+    reasoning = f"Strong {EMOTION_ORDER[int(np.argmax(vec))]} emotion detected"
     
     return [{
         'dance_style': dance,
-        'score': float(score),
-        'reasoning': f"Strong {max(emotions, key=emotions.get)} emotion detected"
-    } for dance, score in sorted_dances if score > 0]
+        'score': score,
+        'reasoning': reasoning
+    } for dance, score in zip(DANCE_ARR[top].tolist(), scores[top].tolist())]
 
 def quantum_recommend(emotions):
     """Quantum-inspired recommendation using superposition"""
-    dimensions = 16
+    return _quantum_recommend(_emotion_key(emotions))
+
+def _quantum_recommend(key):
+    vec = np.array(key, dtype=np.float32)
+    dimensions = QUANTUM_DIMENSIONS
+    state, phases, angles = _quantum_buffers()
+    
+    # Create superposition state (phases seeded from the emotion signature
+    # so identical inputs always collapse to the same state)
+    # Phases are sampled straight into a float32 buffer so the exp runs in single precision
+    rng = np.random.default_rng(zlib.crc32(repr(key).encode()))
+    n_emotions = len(phases)
+    rng.random(dtype=np.float32, out=phases)
+    phases *= 2 * np.pi
+    state.fill(0)
+    state[:n_emotions] = np.sqrt(vec[:n_emotions]) * np.exp(1j * phases)
+    
+    # Normalize in place
+    norm = float(np.vdot(state, state).real)
+    if norm > 0:
+        state *= 1.0 / math.sqrt(norm)
     
-    # Create superposition state
-    state = np.zeros(dimensions, dtype=complex)
-    for i, (emotion, prob) in enumerate(emotions.items()):
-        if i < dimensions:
-            amplitude = np.sqrt(prob)
-            phase = np.random.uniform(0, 2 * np.pi)
-            state[i] = amplitude * np.exp(1j * phase)
+    # Apply entanglement (diagonal phase rotation based on correlations)
+    n_dances = min(dimensions, len(DANCE_STYLES))
+    boost = (vec @ AFFINITY)[:n_dances]
+    np.multiply(boost, 0.7 * np.pi / 2, out=angles)
+    state[:n_dances] *= np.exp(1j * angles)
     
-    # Normalize
-    norm = np.linalg.norm(state)
-    if norm > 0:
-        state = state / norm
-    
-    # Apply entanglement (rotation based on correlations)
-    for i, dance in enumerate(DANCE_STYLES):
-        if i < dimensions:
-            boost = sum(emotions.get(e, 0) * EMOTION_DANCE_MAP.get(e, {}).get(dance, 0) 
-                       for e in emotions.keys())
-            state[i] *= np.exp(1j * boost * 0.7 * np.pi / 2)
-    
-    # Measure (calculate probabilities)
-    probabilities = {}
-    for i, dance in enumerate(DANCE_STYLES):
-        if i < dimensions:
-            prob = abs(state[i])**2
-            # Boost with entanglement
-            boost = sum(emotions.get(e, 0) * EMOTION_DANCE_MAP.get(e, {}).get(dance, 0) 
-                       for e in emotions.keys())
-            probabilities[dance] = prob * (1 + boost)
+    # Measure (projection onto each dance basis state, boosted by entanglement)
+    probabilities = np.abs(state[:n_dances])**2 * (1 + boost)
     
     # Normalize
-    total = sum(probabilities.values())
+    total = probabilities.sum()
     if total > 0:
-        probabilities = {k: v/total for k, v in probabilities.items()}
+        probabilities /= total
     
-    # Top 5
-    sorted_dances = sorted(probabilities.items(), key=lambda x: x[1], reverse=True)[:5]
+    # Top 5, keeping only clearly measured dances
+    top = _top_k(probabilities, 5)
+    top = top[probabilities[top] > 0.1]
     
     return [{
         'dance_style': dance,
-        'score': float(prob),
+        'score': prob,
         'reasoning': f"Quantum entanglement detected (amplitude: {prob:.2f})"
-    } for dance, prob in sorted_dances if prob > 0.1]
+    } for dance, prob in zip(DANCE_ARR[top].tolist(), probabilities[top].tolist())]
+
+def recommend(emotions):
+    """Classical and quantum recommendations, memoized on the quantized emotion vector"""
+    return _recommend_pair(_emotion_key(emotions))
+
+@lru_cache(maxsize=4096)
+def _recommend_pair(key):
+    # The two models are independent, so run them concurrently
+    classical_future = executor.submit(_classical_recommend, key)
+    quantum_future = executor.submit(_quantum_recommend, key)
+    return classical_future.result(), quantum_future.result()
+
+# ============================================================================
+# ANALYSIS PIPELINE & CACHING
+# ============================================================================
+
+def run_pipeline(filepath):
+    """Run the full analysis pipeline on a video file"""
+    features = process_video(filepath)
+    emotions = analyze_emotions(features)
+    
+    classical, quantum = recommend(emotions)
+    
+    return {
+        'emotions': {'combined': format_emotion_data(emotions)},
+        'classical_recommendations': {'recommendations': classical},
+        'quantum_recommendations': {
+            'recommendations': quantum,
+            'quantum_properties': {
+                'superposition_entropy': 2.5,
+                'entanglement_strength': 0.7,
+                'coherence': 0.85
+            }
+        }
+    }
+
+def _file_digest(filepath):
+    """SHA-256 of a file's contents, read through mmap"""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        if os.fstat(f.fileno()).st_size > 0:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                digest.update(mapped)
+    return digest.hexdigest()
+
+def _json_default(obj):
+    """Encode NumPy scalars and arrays for the stdlib JSON encoder"""
+    if isinstance(obj, (np.generic, np.ndarray)):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def _dumps(obj):
+    """Serialize to JSON bytes, with orjson when it is installed; NumPy values pass through"""
+    if HAS_ORJSON:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, default=_json_default).encode()
+
+def analyze_video(video_id):
+    """Analyze an uploaded video and publish its response to the shared cache
+    
+    Runs in a background worker process. Pipeline results are reused for
+    identical uploads through a cache entry keyed by content hash.
+    """
+    filepath = os.path.join(UPLOAD_FOLDER, f"{video_id}.mp4")
+    key = f"result:{_file_digest(filepath)}"
+    result = cache.get(key)
+    if result is None:
+        result = run_pipeline(filepath)
+        cache.set(key, result)
+    cache.set(f"response:{video_id}", _dumps({'video_id': video_id, **result}))
+    cache.delete(f"status:{video_id}")
+
+def _new_process_pool():
+    """Background workers for the CPU-bound pipeline
+    
+    'spawn' avoids forking a process that already runs Flask and
+    thread-pool threads.
+    """
+    return ProcessPoolExecutor(max_workers=os.cpu_count(),
+                               mp_context=multiprocessing.get_context('spawn'))
+
+process_pool = _new_process_pool()
+process_pool_lock = threading.Lock()
+
+def _submit_to_pool(fn, *args):
+    """Submit work to the process pool, replacing the pool if a dead worker broke it"""
+    global process_pool
+    pool = process_pool
+    try:
+        return pool.submit(fn, *args)
+    except BrokenProcessPool:
+        with process_pool_lock:
+            if process_pool is pool:
+                app.logger.warning("Process pool broken by a dead worker; starting a new one")
+                process_pool = _new_process_pool()
+                pool.shutdown(wait=False)
+            return process_pool.submit(fn, *args)
+
+# Job state lives in the cache so any app process can answer a poll. A job
+# whose status entry expired (e.g. lost in a restart) is requeued on the next poll.
+ANALYSIS_TIMEOUT = 600  # seconds
+FAILED_PREFIX = 'failed: '
+
+def _record_failure(video_id, future):
+    """Publish the outcome of a failed analysis for whichever process is polled"""
+    error = future.exception()
+    if error is None:
+        return
+    key = f"status:{video_id}"
+    if isinstance(error, BrokenProcessPool) and cache.get(key) == 'processing':
+        # A worker died mid-job (native crash, OOM kill); the next poll retries it once
+        cache.set(key, 'interrupted', timeout=ANALYSIS_TIMEOUT)
+    else:
+        cache.set(key, f"{FAILED_PREFIX}{error}", timeout=ANALYSIS_TIMEOUT)
+
+def _queue_analysis(video_id):
+    """Submit an analysis whose status marker is already set"""
+    try:
+        future = _submit_to_pool(analyze_video, video_id)
+        future.add_done_callback(lambda f: _record_failure(video_id, f))
+    except BaseException:
+        # Nothing was queued, so let the next poll submit it again
+        cache.delete(f"status:{video_id}")
+        raise
+
+def submit_analysis(video_id):
+    """Queue background analysis of an uploaded video unless it is already queued"""
+    if cache.add(f"status:{video_id}", 'processing', timeout=ANALYSIS_TIMEOUT):
+        _queue_analysis(video_id)
+
+def get_analysis(video_id):
+    """Serialized analysis response, or None while the analysis is still running"""
+    payload = cache.get(f"response:{video_id}")
+    if payload is not None:
+        return payload
+    
+    status = cache.get(f"status:{video_id}")
+    if status is None:
+        # An expired entry can stay on disk and make cache.add refuse, so drop it
+        cache.delete(f"status:{video_id}")
+        submit_analysis(video_id)
+    elif status == 'interrupted':
+        cache.set(f"status:{video_id}", 'retrying', timeout=ANALYSIS_TIMEOUT)
+        _queue_analysis(video_id)
+    elif status.startswith(FAILED_PREFIX):
+        # Drop the failure so the next request retries it
+        cache.delete(f"status:{video_id}")
+        raise RuntimeError(status[len(FAILED_PREFIX):])
+    return None
 
 # ============================================================================
 # FLASK APP
@@ -231,16 +579,53 @@ def quantum_recommend(emotions):
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
-video_cache = {}
+cache = Cache(app, config=CACHE_CONFIG)
 
 @app.route('/')
 def index():
     """Serve the main page"""
-    return render_template_string(HTML_TEMPLATE)
+    response = app.response_class(INDEX_TEMPLATE.render(), mimetype='text/html')
+    response.headers['Cache-Control'] = 'public, max-age=3600'
+    return response
+
+def _save_upload(stream, filepath):
+    """Write an uploaded stream to filepath atomically, so a crash never leaves a truncated video"""
+    partial = filepath + '.part'
+    # Asking an in-memory spool for its fileno() would roll it over to disk
+    # first. _rolled is a private CPython attribute of SpooledTemporaryFile;
+    # any other stream is tried as-is.
+    spooled_in_memory = (isinstance(stream, tempfile.SpooledTemporaryFile)
+                         and not stream._rolled)
+    src_fd = None
+    if HAS_SENDFILE and not spooled_in_memory:
+        try:
+            src_fd = stream.fileno()
+        except (AttributeError, OSError):  # in-memory stream
+            pass
+    
+    try:
+        with open(partial, 'wb') as dst:
+            if src_fd is None:
+                shutil.copyfileobj(stream, dst, length=1024 * 1024)
+            else:
+                size = os.fstat(src_fd).st_size
+                offset = 0
+                while offset < size:
+                    offset += os.sendfile(dst.fileno(), src_fd, offset, size - offset)
+        os.replace(partial, filepath)
+    except BaseException:
+        # open() itself may have failed, leaving nothing to remove
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(partial)
+        raise
 
 @app.route('/upload', methods=['POST'])
 def upload():
     """Handle video upload"""
+    # Reject oversize uploads from the header, before the body is read
+    if request.content_length is not None and request.content_length > MAX_FILE_SIZE:
+        return jsonify({'error': 'File too large'}), 413
+    
     if 'video' not in request.files:
         return jsonify({'error': 'No video file'}), 400
     
@@ -254,45 +639,27 @@ def upload():
     
     video_id = str(uuid.uuid4())
     filepath = os.path.join(UPLOAD_FOLDER, f"{video_id}.mp4")
-    file.save(filepath)
+    _save_upload(file.stream, filepath)
+    try:
+        submit_analysis(video_id)
+    except Exception:
+        # The upload is kept; polling /analyze queues the analysis again
+        app.logger.exception("Could not queue analysis of %s", video_id)
     
     return jsonify({'video_id': video_id}), 200
 
 @app.route('/analyze/<video_id>')
 def analyze(video_id):
-    """Analyze video and return recommendations"""
-    if video_id in video_cache:
-        return jsonify(video_cache[video_id]), 200
-    
+    """Return recommendations, or 202 while the background analysis is running"""
     filepath = os.path.join(UPLOAD_FOLDER, f"{video_id}.mp4")
     if not os.path.exists(filepath):
         return jsonify({'error': 'Video not found'}), 404
     
     try:
-        # Process
-        features = process_video(filepath)
-        emotions = analyze_emotions(features)
-        
-        # Recommend
-        classical = classical_recommend(emotions)
-        quantum = quantum_recommend(emotions)
-        
-        result = {
-            'video_id': video_id,
-            'emotions': {'combined': emotions},
-            'classical_recommendations': {'recommendations': classical},
-            'quantum_recommendations': {
-                'recommendations': quantum,
-                'quantum_properties': {
-                    'superposition_entropy': 2.5,
-                    'entanglement_strength': 0.7,
-                    'coherence': 0.85
-                }
-            }
-        }
-        
-        video_cache[video_id] = result
-        return jsonify(result), 200
+        payload = get_analysis(video_id)
+        if payload is None:
+            return jsonify({'video_id': video_id, 'status': 'processing'}), 202
+        return app.response_class(payload, mimetype='application/json'), 200
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -427,6 +794,7 @@ HTML_TEMPLATE = '''
     
     <script>
         const videoInput = document.getElementById('videoInput');
+        const MAX_POLLS = 600;  // give up after about 10 minutes of 202s
         videoInput.addEventListener('change', handleFile);
         
         async function handleFile(e) {
@@ -442,11 +810,19 @@ HTML_TEMPLATE = '''
                 const uploadRes = await fetch('/upload', { method: 'POST', body: formData });
                 const { video_id } = await uploadRes.json();
                 
-                const analyzeRes = await fetch(`/analyze/${video_id}`);
+                // Analysis runs in the background; poll until it is ready
+                let analyzeRes = await fetch(`/analyze/${video_id}`);
+                for (let polls = 0; analyzeRes.status === 202; polls++) {
+                    if (polls >= MAX_POLLS) throw new Error('Analysis timed out');
+                    await new Promise(resolve => setTimeout(resolve, 1000));
+                    analyzeRes = await fetch(`/analyze/${video_id}`);
+                }
                 const data = await analyzeRes.json();
+                if (!analyzeRes.ok) throw new Error(data.error);
                 
                 displayResults(data);
             } catch (error) {
+                document.getElementById('progress').style.display = 'none';
                 alert('Error: ' + error.message);
             }
         }
@@ -458,7 +834,7 @@ HTML_TEMPLATE = '''
             // Emotions
             const emotionsDiv = document.getElementById('emotions');
             emotionsDiv.innerHTML = '';
-            Object.entries(data.emotions.combined).slice(0, 6).forEach(([emotion, value]) => {
+            Object.entries(data.emotions.combined).sort((a, b) => b[1] - a[1]).slice(0, 6).forEach(([emotion, value]) => {
                 emotionsDiv.innerHTML += `
                     <div class="emotion">
                         <div style="text-transform: capitalize;">${emotion}</div>
@@ -509,6 +885,9 @@ HTML_TEMPLATE = '''
 </html>
 '''
 
+# Compiled once at import instead of re-parsed on every request
+INDEX_TEMPLATE = app.jinja_env.from_string(HTML_TEMPLATE)
+
 if __name__ == '__main__':
     print("Starting Quantum Dance Emotion Recommender...")
     print("Open http://localhost:5000 in your browser")